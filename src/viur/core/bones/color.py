@@ -1,6 +1,9 @@
-import string
+import re
 from viur.core.bones.base import BaseBone, ReadFromClientError, ReadFromClientErrorSeverity
 
+_RGB_RE = re.compile(r"#?([0-9a-f]{3}|[0-9a-f]{6})")
+_RGBA_RE = re.compile(r"#?([0-9a-f]{8})")
+
 
 class ColorBone(BaseBone):
     r"""
@@ -20,31 +23,13 @@ class ColorBone(BaseBone):
 
     def singleValueFromClient(self, value, skel, bone_name, client_data):
         value = value.lower()
-        if value.count("#") > 1:
+        if not (match := (_RGBA_RE if self.mode == "rgba" else _RGB_RE).fullmatch(value)):
             return self.getEmptyValue(), [
                 ReadFromClientError(ReadFromClientErrorSeverity.Invalid, "Invalid value entered")]
-        for char in value:
-            if char not in string.hexdigits + "#":
-                return self.getEmptyValue(), [
-                    ReadFromClientError(ReadFromClientErrorSeverity.Invalid, "Invalid value entered")]
-        if self.mode == "rgb":
-            if len(value) == 3:
-                value = "#" + value
-            if len(value) == 4:
-                value = value[0:2] + value[1] + 2 * value[2] + 2 * value[3]
-            if len(value) == 6 or len(value) == 7:
-                if len(value) == 6:
-                    value = "#" + value
-            else:
-                return self.getEmptyValue(), [
-                    ReadFromClientError(ReadFromClientErrorSeverity.Invalid, "Invalid value entered")]
-        if self.mode == "rgba":
-            if len(value) == 8 or len(value) == 9:
-                if len(value) == 8:
-                    value = "#" + value
-            else:
-                return self.getEmptyValue(), [
-                    ReadFromClientError(ReadFromClientErrorSeverity.Invalid, "Invalid value entered")]
+        value = match.group(1)
+        if len(value) == 3:  # expand short notation, e.g. "abc" to "aabbcc"
+            value = "".join(char * 2 for char in value)
+        value = "#" + value
         err = self.isInvalid(value)
         if not err:
             return value, None
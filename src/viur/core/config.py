@@ -467,6 +467,10 @@ class Debug(ConfigType):
     disable_cache: bool = False
     """If set to true, the decorator @enableCache from viur.core.cache has no effect"""
 
+    template_reload: bool = False
+    """If enabled, the html-render doesn't cache resolved template filenames
+    and checks templates for modifications, as it is always done on the development server"""
+
     _mapping = {
         "skeleton.fromClient": "skeleton_from_client",
         "traceExceptions": "trace_exceptions",
@@ -1,12 +1,16 @@
-import codecs
 import collections
 import enum
 import functools
+import hashlib
 import logging
 import os
+import pathlib
 import typing as t
 
-from jinja2 import ChoiceLoader, Environment, FileSystemLoader, Template
+from jinja2 import (
+    BaseLoader, BytecodeCache, ChoiceLoader, Environment, FileSystemBytecodeCache, FileSystemLoader, Template,
+)
+from jinja2.bccache import Bucket
 
 from viur.core import conf, current, db, errors, securitykey
 from viur.core.bones import *
@@ -17,6 +21,62 @@ from ..json.default import CustomJsonEncoder
 
 KeyValueWrapper = collections.namedtuple("KeyValueWrapper", ["key", "descr"])
 
+_SKEY_BONE = BaseBone(descr="SecurityKey", readOnly=True, visible=False)
+"""Bone for the security key, which is attached to any skeleton rendered by :meth:`Render.render_action_template`"""
+
+
+def _reload_templates() -> bool:
+    """
+        Determines if templates may change at runtime, so that they must not be cached.
+
+        This is the case on the development server or when ``conf.debug.template_reload`` is enabled.
+    """
+    return conf.instance.is_dev_server or conf.debug.template_reload
+
+
+class RenderBytecodeCache(FileSystemBytecodeCache):
+    """
+        Bytecode cache used by :meth:`Render.getBytecodeCache`.
+
+        Jinja2 identifies cached bytecode only by the template's name and source, but environments
+        may compile templates differently (e.g. when a module's ``jinjaEnv`` changes ``trim_blocks``).
+        Therefore, the compile-time settings of the environment are made part of the cache key.
+    """
+
+    def get_bucket(self, environment: Environment, name: str, filename: str | None, source: str) -> Bucket:
+        return super().get_bucket(environment, f"{self.get_environment_key(environment)}:{name}", filename, source)
+
+    @staticmethod
+    def get_environment_key(environment: Environment) -> str:
+        """
+            Returns a key describing all settings of an environment which affect the compiled templates.
+        """
+        def describe(value: t.Any) -> str:
+            if callable(value):
+                return f"{value.__module__}.{value.__qualname__}"
+            return repr(value)
+
+        settings = (
+            environment.block_start_string,
+            environment.block_end_string,
+            environment.variable_start_string,
+            environment.variable_end_string,
+            environment.comment_start_string,
+            environment.comment_end_string,
+            environment.line_statement_prefix,
+            environment.line_comment_prefix,
+            environment.trim_blocks,
+            environment.lstrip_blocks,
+            environment.newline_sequence,
+            environment.keep_trailing_newline,
+            environment.optimized,
+            describe(environment.autoescape),
+            describe(environment.finalize),
+            sorted(environment.extensions),
+        )
+
+        return hashlib.sha1(repr(settings).encode()).hexdigest()
+
 
 class Render(object):
     """
@@ -55,6 +115,15 @@ class Render(object):
 
     __haveEnvImported_ = False
 
+    _template_filename_cache: dict[tuple, str] = {}
+    """Process-wide cache of resolved template filenames, see :meth:`getTemplateFileName`"""
+
+    _template_dir_cache: dict[str, set[str]] = {}
+    """Process-wide cache of the files in template directories, see :meth:`_template_file_exists`"""
+
+    _bytecode_cache: BytecodeCache | None = None
+    """Process-wide Jinja2 bytecode cache, see :meth:`getBytecodeCache`"""
+
     def __init__(self, parent=None, *args, **kwargs):
         super(Render, self).__init__(*args, **kwargs)
         if not Render.__haveEnvImported_:
@@ -64,6 +133,18 @@ class Render(object):
             Render.__haveEnvImported_ = True
         self.parent = parent
 
+        # Handlers used by renderBoneValue(), by the bone type's prefix
+        self._bone_value_handlers = {
+            "select": self._render_select_value,
+            "relational": self._render_relational_value,
+            "record": self._render_record_value,
+            "password": self._render_password_value,
+            "key": self._render_key_value,
+        }
+
+        # Compiled templates used by renderEmail(), by their file name
+        self._email_template_cache: dict[str, Template] = {}
+
     def getTemplateFileName(
         self,
         template: str | list[str] | tuple[str],
@@ -77,9 +158,13 @@ class Render(object):
             The style is provided as get-parameters for special-case templates that differ from
             their usual way.
 
+            Templates are searched in the directories provided by :meth:`getTemplatePaths`.
             It is advised to override this function in case that
             :func:`viur.core.render.jinja2.default.Render.getLoaders` is redefined.
 
+            Resolved filenames are cached per process,
+            unless running on the development server or ``conf.debug.template_reload`` is enabled.
+
             :param template: The basename of the template to use. This can optionally be also a sequence of names.
             :param ignoreStyle: Ignore any maybe given style hints.
             :param raise_exception: Defaults to raise an exception when not found, otherwise returns None.
@@ -87,7 +172,7 @@ class Render(object):
             :returns: Filename of the template
         """
         validChars = "abcdefghijklmnopqrstuvwxyz1234567890-"
-        htmlpath = getattr(self, "htmlpath", "html")
+        template_paths = self.getTemplatePaths()
 
         if (
             not ignoreStyle
@@ -103,6 +188,10 @@ class Render(object):
         if not isinstance(template, (tuple, list)):
             template = (template,)
 
+        cache_key = (tuple(template), style_postfix, lang, tuple(template_paths))
+        if not _reload_templates() and (filename := Render._template_filename_cache.get(cache_key)):
+            return filename
+
         for tpl in template:
             filenames = [tpl]
             if style_postfix:
@@ -117,17 +206,17 @@ class Render(object):
             for filename in reversed(filenames):
                 filename += ".html"
 
+                candidates = [filename]
                 if "_" in filename:
                     dirname, tail = filename.split("_", 1)
                     if tail:
-                        if conf.instance.project_base_path.joinpath(htmlpath, dirname, filename).is_file():
-                            return os.path.join(dirname, filename)
+                        candidates.insert(0, os.path.join(dirname, filename))
 
-                if conf.instance.project_base_path.joinpath(htmlpath, filename).is_file():
-                    return filename
-
-                if conf.instance.core_base_path.joinpath("viur", "core", "template", filename).is_file():
-                    return filename
+                for path in template_paths:
+                    for candidate in candidates:
+                        if self._template_file_exists(path / candidate):
+                            Render._template_filename_cache[cache_key] = candidate
+                            return candidate
 
         msg = f"""Template {" or ".join((repr(tpl) for tpl in template))} not found."""
         if raise_exception:
@@ -136,6 +225,40 @@ class Render(object):
         logging.error(msg)
         return None
 
+    @staticmethod
+    def _template_file_exists(path: pathlib.Path) -> bool:
+        """
+            Checks if a template file exists.
+
+            The files of each directory are listed only once per process and cached,
+            unless running on the development server or ``conf.debug.template_reload`` is enabled.
+        """
+        if _reload_templates():
+            return path.is_file()
+
+        dirname = str(path.parent)
+        if (files := Render._template_dir_cache.get(dirname)) is None:
+            try:
+                with os.scandir(dirname) as entries:
+                    files = {entry.name for entry in entries if entry.is_file()}
+            except OSError:  # directory doesn't exist or is not accessible
+                files = set()
+
+            Render._template_dir_cache[dirname] = files
+
+        return path.name in files
+
+    def getTemplatePaths(self) -> list[pathlib.Path]:
+        """
+            Return the directories to search for templates, in order of their priority.
+
+            These are used by :meth:`getTemplateFileName` and :meth:`getLoaders`.
+        """
+        return [
+            conf.instance.project_base_path / getattr(self, "htmlpath", "html"),
+            conf.instance.core_base_path / "viur" / "core" / "template",
+        ]
+
     def getLoaders(self) -> ChoiceLoader:
         """
             Return the list of Jinja2 loaders which should be used.
@@ -144,10 +267,40 @@ class Render(object):
             (e.g. for fetching templates from the datastore).
         """
         # fixme: Why not use ChoiceLoader directly for template loading?
-        return ChoiceLoader((
-            FileSystemLoader(getattr(self, "htmlpath", "html")),
-            FileSystemLoader(conf.instance.core_base_path / "viur" / "core" / "template"),
-        ))
+        return ChoiceLoader([FileSystemLoader(path) for path in self.getTemplatePaths()])
+
+    def getBytecodeCache(self) -> BytecodeCache | None:
+        """
+            Return the Jinja2 bytecode cache which should be used.
+
+            By default, one cache is shared by the environments of all renders, so templates compiled
+            for one render are re-used by the others. It stores compiled templates in the system's
+            temporary directory, so they also survive a restart of the process. May be overridden
+            to provide an alternative cache (e.g. a :class:`jinja2.MemcachedBytecodeCache`), or to
+            return None for disabling it. Caches shared between environments must distinguish their
+            settings, as :class:`RenderBytecodeCache` does.
+        """
+        if Render._bytecode_cache is None:
+            try:
+                Render._bytecode_cache = RenderBytecodeCache()
+            except (OSError, RuntimeError) as e:
+                logging.warning(f"Jinja2 bytecode cache is not available: {e}")
+
+        return Render._bytecode_cache
+
+    def getAutoReload(self, loader: BaseLoader) -> bool:
+        """
+            Determines if the Jinja2 environment checks templates for modifications.
+
+            Outside of development, templates from the default file system loaders can't change,
+            so they aren't checked. Other loaders (e.g. fetching templates from the datastore)
+            are always checked. May be overridden to change this behavior.
+        """
+        if _reload_templates():
+            return True
+
+        loaders = loader.loaders if isinstance(loader, ChoiceLoader) else [loader]
+        return not all(type(item) is FileSystemLoader for item in loaders)
 
     def renderBoneValue(self,
                         bone: BaseBone,
@@ -174,69 +327,129 @@ class Render(object):
             res = LanguageWrapper(bone.languages)
             if isinstance(boneValue, dict):
                 for language in bone.languages:
-                    if language in boneValue:
-                        res[language] = self.renderBoneValue(bone, skel, key, boneValue[language], True)
+                    if (value := boneValue.get(language)) is not None:
+                        res[language] = self.renderBoneValue(bone, skel, key, value, True)
             return res
-        elif bone.type == "select" or bone.type.startswith("select."):
-            def get_label(value) -> str:
-                if isinstance(value, enum.Enum):
-                    return bone.values.get(value.value, value.name)
-                return bone.values.get(value, str(value))
-
-            if isinstance(boneValue, list):
-                return {val: get_label(val) for val in boneValue}
-
-            return KeyValueWrapper(boneValue, get_label(boneValue))
-
-        elif bone.type == "relational" or bone.type.startswith("relational."):
-            if isinstance(boneValue, list):
-                tmpList = []
-                for k in boneValue:
-                    if not k:
-                        continue
-                    if bone.using is not None and k["rel"]:
-                        k["rel"].renderPreparation = self.renderBoneValue
-                        usingData = k["rel"]
-                    else:
-                        usingData = None
-                    k["dest"].renderPreparation = self.renderBoneValue
-                    tmpList.append({
-                        "dest": k["dest"],
-                        "rel": usingData
-                    })
-                return tmpList
-            elif isinstance(boneValue, dict):
-                if bone.using is not None and boneValue["rel"]:
-                    boneValue["rel"].renderPreparation = self.renderBoneValue
-                    usingData = boneValue["rel"]
+
+        if handler := self._bone_value_handlers.get(bone.type.split(".", 1)[0]):
+            return handler(bone, skel, key, boneValue)
+
+        return boneValue
+
+    def _render_select_value(
+        self,
+        bone: BaseBone,
+        skel: SkeletonInstance,
+        key: t.Any,
+        boneValue: t.Any,
+    ) -> dict | KeyValueWrapper:
+        """
+        Renders the value of a select bone, see :meth:`renderBoneValue`.
+        """
+        def get_label(value) -> str:
+            if isinstance(value, enum.Enum):
+                return bone.values.get(value.value, value.name)
+            return bone.values.get(value, str(value))
+
+        if isinstance(boneValue, list):
+            return {val: get_label(val) for val in boneValue}
+
+        return KeyValueWrapper(boneValue, get_label(boneValue))
+
+    def _render_relational_value(
+        self,
+        bone: BaseBone,
+        skel: SkeletonInstance,
+        key: t.Any,
+        boneValue: t.Any,
+    ) -> list | dict | None:
+        """
+        Renders the value of a relational bone, see :meth:`renderBoneValue`.
+        """
+        render_preparation = self.renderBoneValue
+
+        def prepare(skel: SkeletonInstance) -> SkeletonInstance:
+            # The same skeleton may be referenced several times; re-assigning
+            # would also drop its already rendered values.
+            if skel.renderPreparation != render_preparation:
+                skel.renderPreparation = render_preparation
+            return skel
+
+        if isinstance(boneValue, list):
+            tmpList = []
+            for k in boneValue:
+                if not k:
+                    continue
+                if bone.using is not None and k["rel"]:
+                    usingData = prepare(k["rel"])
                 else:
                     usingData = None
-                boneValue["dest"].renderPreparation = self.renderBoneValue
-                return {
-                    "dest": boneValue["dest"],
+                tmpList.append({
+                    "dest": prepare(k["dest"]),
                     "rel": usingData
-                }
-        elif bone.type == "record" or bone.type.startswith("record."):
-            value = boneValue
-            if value:
-                if bone.multiple:
-                    ret = []
-                    for entry in value:
-                        entry.renderPreparation = self.renderBoneValue
-                        ret.append(entry)
-                    return ret
-                value.renderPreparation = self.renderBoneValue
-                return value
-        elif bone.type == "password":
-            return ""
-        elif bone.type == "key":
-            return db.encodeKey(boneValue) if boneValue else None
+                })
+            return tmpList
+        elif isinstance(boneValue, dict):
+            if bone.using is not None and boneValue["rel"]:
+                usingData = prepare(boneValue["rel"])
+            else:
+                usingData = None
+            return {
+                "dest": prepare(boneValue["dest"]),
+                "rel": usingData
+            }
 
-        else:
-            return boneValue
+        return None
+
+    def _render_record_value(
+        self,
+        bone: BaseBone,
+        skel: SkeletonInstance,
+        key: t.Any,
+        boneValue: t.Any,
+    ) -> list | SkeletonInstance | None:
+        """
+        Renders the value of a record bone, see :meth:`renderBoneValue`.
+        """
+        render_preparation = self.renderBoneValue
+
+        value = boneValue
+        if value:
+            if bone.multiple:
+                ret = []
+                for entry in value:
+                    entry.renderPreparation = render_preparation
+                    ret.append(entry)
+                return ret
+            value.renderPreparation = render_preparation
+            return value
 
         return None
 
+    def _render_password_value(
+        self,
+        bone: BaseBone,
+        skel: SkeletonInstance,
+        key: t.Any,
+        boneValue: t.Any,
+    ) -> str:
+        """
+        Renders the value of a password bone, which is never exposed, see :meth:`renderBoneValue`.
+        """
+        return ""
+
+    def _render_key_value(
+        self,
+        bone: BaseBone,
+        skel: SkeletonInstance,
+        key: t.Any,
+        boneValue: t.Any,
+    ) -> str | None:
+        """
+        Renders the value of a key bone, see :meth:`renderBoneValue`.
+        """
+        return db.encodeKey(boneValue) if boneValue else None
+
     def get_template(self, action: str, template: str) -> Template:
         """
         Internal function for retrieving a template from an action name.
@@ -274,13 +487,13 @@ class Render(object):
         """
         template = self.get_template(default, tpl)
 
-        skel.skey = BaseBone(descr="SecurityKey", readOnly=True, visible=False)
+        skel.skey = _SKEY_BONE
         skel["skey"] = securitykey.create()
 
         # fixme: Is this still be used?
         if current.request.get().kwargs.get("nomissing") == "1":
             if isinstance(skel, SkeletonInstance):
-                super(SkeletonInstance, skel).__setattr__("errors", [])
+                object.__setattr__(skel, "errors", [])
 
         skel.renderPreparation = self.renderBoneValue
 
@@ -292,6 +505,7 @@ class Render(object):
             },
             action=action,
             params=params,
+           
             **kwargs
         )
 
@@ -326,6 +540,7 @@ class Render(object):
             skel=skel,
             action=action,
             params=params,
+           
             **kwargs
         )
 
@@ -345,8 +560,9 @@ class Render(object):
         """
         template = self.get_template("list", tpl)
 
+        render_preparation = self.renderBoneValue
         for skel in skellist:
-            skel.renderPreparation = self.renderBoneValue
+            skel.renderPreparation = render_preparation
 
         return template.render(skellist=skellist, action=action, params=params, **kwargs)
 
@@ -456,6 +672,8 @@ class Render(object):
 
             :param dests: Destination recipients.
             :param file: The name of a template from the deploy/emails directory.
+                The compiled template is cached,
+                unless running on the development server or ``conf.debug.template_reload`` is enabled.
             :param template: This string is interpreted as the template contents. Alternative to load from template file.
             :param skel: Skeleton or dict which data to supply to the template.
             :return: Returns the rendered email subject and body.
@@ -467,17 +685,27 @@ class Render(object):
             for x in skel:
                 if isinstance(x, SkeletonInstance):
                     x.renderPreparation = self.renderBoneValue
+
+        env = self.getEnv()
+
         if file is not None:
-            try:
-                tpl = self.getEnv().from_string(codecs.open("emails/" + file + ".email", "r", "utf-8").read())
-            except Exception as err:
-                logging.exception(err)
-                tpl = self.getEnv().get_template(file + ".email")
+            if _reload_templates() or not (tpl := self._email_template_cache.get(file)):
+                try:
+                    with open(os.path.join("emails", file + ".email"), "r", encoding="utf-8") as f:
+                        tpl = env.from_string(f.read())
+                except Exception as err:
+                    logging.exception(err)
+                    tpl = env.get_template(file + ".email")
+
+                self._email_template_cache[file] = tpl
+        else:
+            tpl = env.from_string(template)
+        content = tpl.render(skel=skel, dests=dests, **kwargs).lstrip()
+        content = content.removesuffix("\n").removesuffix("\r")  # a trailing line break doesn't start a body
+        if (subject_end := content.find("\n")) < 0:
+            subject, body = "", content  # add empty subject
         else:
-            tpl = self.getEnv().from_string(template)
-        content = tpl.render(skel=skel, dests=dests, **kwargs).lstrip().splitlines()
-        if len(content) == 1:
-            content.insert(0, "")  # add empty subject
+            subject, body = content[:subject_end].rstrip("\r"), content[subject_end + 1:].lstrip()
 
         if isinstance(skel, SkeletonInstance):
             skel.renderPreparation = None
@@ -487,7 +715,7 @@ class Render(object):
                 if isinstance(x, SkeletonInstance):
                     x.renderPreparation = None
 
-        return content[0], os.linesep.join(content[1:]).lstrip()
+        return subject, body
 
     def getEnv(self) -> Environment:
         """
@@ -498,9 +726,11 @@ class Render(object):
 
             :return: Extended Jinja2 environment.
         """
-        if "env" not in dir(self):
+        if "env" not in self.__dict__:
             loaders = self.getLoaders()
             self.env = Environment(loader=loaders,
+                                   bytecode_cache=self.getBytecodeCache(),
+                                   auto_reload=self.getAutoReload(loaders),
                                    extensions=["jinja2.ext.do", "jinja2.ext.loopcontrols", TranslationExtension])
             self.env.trCache = {}
             self.env.policies["json.dumps_kwargs"]["cls"] = CustomJsonEncoder
@@ -522,7 +752,7 @@ class Render(object):
                 self.env.add_extension(ext)
 
             # Import module-specific environment, if available.
-            if "jinjaEnv" in dir(self.parent):
+            if hasattr(self.parent, "jinjaEnv"):
                 self.env = self.parent.jinjaEnv(self.env)
 
         return self.env
@@ -1,5 +1,3 @@
-from collections import OrderedDict
-
 import logging
 import os
 import typing as t
@@ -587,7 +585,7 @@ def renderEditForm(render: Render,
 
     sectionTpl = render.getEnv().get_template(render.getTemplateFileName("editform_category"))
     rowTpl = render.getEnv().get_template(render.getTemplateFileName("editform_row"))
-    sections = OrderedDict()
+    sections = {}
 
     if ignore and bones and (both := set(ignore).intersection(bones)):
         raise ValueError(f"You have specified the same bones {', '.join(both)} in *ignore* AND *bones*!")
@@ -595,10 +593,8 @@ def renderEditForm(render: Render,
         category = str("server.render.html.default_category")
         if "params" in boneParams and isinstance(boneParams["params"], dict):
             category = boneParams["params"].get("category", category)
-        if not category in sections:
-            sections[category] = []
 
-        sections[category].append((boneName, boneParams))
+        sections.setdefault(category, []).append((boneName, boneParams))
 
     for category, boneList in sections.items():
         allReadOnly = True
@@ -0,0 +1,51 @@
+import unittest
+
+
+class TestColorBone(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch
+        monkey_patch()
+        cls.bone_name = "myColorBone"
+
+    def test_singleValueFromClient_rgb(self):
+        from viur.core.bones import ColorBone
+        bone = ColorBone()
+        skel = {}
+        for value, expected in (
+            ("#aabbcc", "#aabbcc"),
+            ("AABBCC", "#aabbcc"),
+            ("#abc", "#aabbcc"),
+            ("f0a", "#ff00aa"),
+        ):
+            self.assertEqual((expected, None), bone.singleValueFromClient(value, skel, self.bone_name, None))
+
+    def test_singleValueFromClient_rgba(self):
+        from viur.core.bones import ColorBone
+        bone = ColorBone(mode="rgba")
+        skel = {}
+        for value, expected in (
+            ("#aabbcc00", "#aabbcc00"),
+            ("AABBCCFF", "#aabbccff"),
+        ):
+            self.assertEqual((expected, None), bone.singleValueFromClient(value, skel, self.bone_name, None))
+
+    def test_singleValueFromClient_invalid(self):
+        from viur.core.bones import ColorBone
+        from viur.core.bones import ReadFromClientError
+        from viur.core.bones import ReadFromClientErrorSeverity
+        skel = {}
+        for bone, value in (
+            (ColorBone(), ""),
+            (ColorBone(), "##abc"),
+            (ColorBone(), "ab#cdef"),
+            (ColorBone(), "#abcd"),
+            (ColorBone(), "#aabbcg"),
+            (ColorBone(), "#aabbcc00"),
+            (ColorBone(mode="rgba"), "#aabbcc"),
+            (ColorBone(mode="rgba"), "#abcd"),
+        ):
+            res = bone.singleValueFromClient(value, skel, self.bone_name, None)
+            self.assertEqual(bone.getEmptyValue(), res[0])
+            self.assertIsInstance(rfce := res[1][0], ReadFromClientError)
+            self.assertIs(ReadFromClientErrorSeverity.Invalid, rfce.severity)
@@ -22,6 +22,8 @@ def monkey_patch():
     MOCK_MODULES = (
         "google.appengine.api",
         "google.auth.default",
+        "google.auth.transport.requests",
+        "google.auth.transport",
         "google.auth",
         "google.cloud.exceptions",
         "google.cloud.logging_v2",
@@ -32,6 +34,7 @@ def monkey_patch():
         "google.cloud.tasks_v2",
         "google.cloud",
         "google.oauth2",
+        "google.oauth2.id_token",
         "google.oauth2.service_account",
         "google.protobuf",
         "google",
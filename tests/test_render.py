@@ -0,0 +1,137 @@
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+
+class Parent:
+    def __init__(self, name):
+        self.name = name
+
+
+class JinjaEnvParent(Parent):
+    def jinjaEnv(self, env):
+        env.globals["module_name"] = self.name
+        return env
+
+
+class TrimBlocksParent(Parent):
+    def jinjaEnv(self, env):
+        env.trim_blocks = True
+        return env
+
+
+class TestHtmlRender(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch
+        monkey_patch()
+
+    def setUp(self) -> None:
+        from viur.core import current
+        from viur.core.render.html import utils as jinjaUtils
+        current.request.set(mock.Mock(template_style=None))
+
+        def render_parent_name(render):
+            return render.parent.name
+
+        patcher = mock.patch.dict(jinjaUtils.getGlobalFunctions(), {"render_parent_name": render_parent_name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.htmlpath = pathlib.Path(tempdir.name)
+
+        for name, source in {
+            "name.html": "{{ render_parent_name() }}",
+            "macros.html": "{% macro name() %}M:{{ render_parent_name() }}{% endmacro %}",
+            "import.html": "{% import 'macros.html' as m %}{{ m.name() }}",
+            "module.html": "{{ module_name }}",
+            "blocks.html": "{% if true %}\nX\n{% endif %}|",
+        }.items():
+            (self.htmlpath / name).write_text(source)
+
+    def _render(self, parent):
+        from viur.core.render.html.default import Render
+
+        render = Render(parent=parent)
+        render.htmlpath = str(self.htmlpath)
+        return render
+
+    def test_render_binding(self):
+        r1 = self._render(Parent("r1"))
+        r2 = self._render(Parent("r2"))
+        self.assertIsNot(r1.getEnv(), r2.getEnv())
+
+        template = r1.getEnv().get_template("name.html")
+        r2.getEnv().get_template("name.html")
+        self.assertEqual("r1", template.render())
+        self.assertEqual("r1", r1.list([], tpl="name"))
+        self.assertEqual("r2", r2.list([], tpl="name"))
+
+    def test_imported_macros(self):
+        r1 = self._render(Parent("r1"))
+        r2 = self._render(Parent("r2"))
+
+        self.assertEqual("M:r1", r1.list([], tpl="import"))
+        self.assertEqual("M:r2", r2.list([], tpl="import"))
+        self.assertEqual("M:r1", r1.list([], tpl="import"))
+
+    def test_bytecode_cache_shared(self):
+        r1 = self._render(Parent("r1"))
+        r2 = self._render(Parent("r2"))
+        self.assertIsNotNone(r1.getEnv().bytecode_cache)
+        self.assertIs(r1.getEnv().bytecode_cache, r2.getEnv().bytecode_cache)
+
+        self.assertEqual("r1", r1.getEnv().from_string("{{ render_parent_name() }}").render())
+
+    def test_jinja_env_per_instance(self):
+        r1 = self._render(JinjaEnvParent("m1"))
+        r2 = self._render(JinjaEnvParent("m2"))
+        self.assertIsNot(r1.getEnv(), r2.getEnv())
+
+        self.assertEqual("m1", r1.list([], tpl="module"))
+        self.assertEqual("m2", r2.list([], tpl="module"))
+
+    def test_bytecode_cache_per_environment(self):
+        r1 = self._render(Parent("r1"))
+        r2 = self._render(TrimBlocksParent("r2"))
+        self.assertIsNotNone(r1.getEnv().bytecode_cache)
+
+        self.assertEqual("\nX\n|", r1.list([], tpl="blocks"))
+        self.assertEqual("X\n|", r2.list([], tpl="blocks"))
+
+    def test_template_reload_on_dev_server(self):
+        from viur.core import conf
+        render = self._render(Parent("r1"))
+
+        with mock.patch.object(conf.instance, "is_dev_server", True):
+            self.assertIsNone(render.getTemplateFileName("new", raise_exception=False))
+            (self.htmlpath / "new.html").write_text("new")
+            self.assertEqual("new.html", render.getTemplateFileName("new"))
+
+    def test_auto_reload(self):
+        from jinja2 import DictLoader
+        from viur.core import conf
+        render = self._render(Parent("r1"))
+
+        self.assertFalse(render.getEnv().auto_reload)
+        self.assertTrue(render.getAutoReload(DictLoader({})))
+        with mock.patch.object(conf.instance, "is_dev_server", True):
+            self.assertTrue(render.getAutoReload(render.getLoaders()))
+
+    def test_renderEmail(self):
+        render = self._render(Parent("r1"))
+
+        for template, expected in (
+            ("", ("", "")),
+            ("Body", ("", "Body")),
+            ("Body\n", ("", "Body")),
+            ("S\nBody", ("S", "Body")),
+            ("S\nBody\n", ("S", "Body")),
+            ("S\nBody\n\n\n", ("S", "Body\n")),
+            ("\n  S\n\n  Line1\n\nLine2\n", ("S", "Line1\n\nLine2")),
+            ("{{ render_parent_name() }}\nBody", ("r1", "Body")),
+        ):
+            self.assertEqual(expected, render.renderEmail([], template=template), template)